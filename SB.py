@@ -1,7 +1,21 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import collections
 import datetime
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+import sqlite3
+import uuid
+import tempfile
+import threading
+from contextlib import closing, contextmanager
 import requests
 import pandas as pd
 import streamlit as st
@@ -18,15 +32,32 @@ DEFAULT_FEE = 4  # payment amount when marking paid
 
 EXPECTED_COLUMNS = [
     "Date", "Player Name", "Paid", "Court", "Time Slot",
-    "Collection", "Expense", "Balance", "Description"
+    "Collection", "Expense", "Balance", "Description",
+    "Entry ID",  # journal id of appended bookings/expenses, blank for signups
 ]
 initial_balance = 57
 
+COURT_NUMBERS = [1, 2, 3, 4, 5]
+COURT_SLOT_PRICES = {"2–3pm": 6, "2–4pm": 12, "3–4pm": 6, "4–5pm": 6}  # SGD per booking
+PLAYERS_PER_COURT_HOUR = 3  # default planning target
+
+IMPORT_CHUNK_SIZE = 500   # rows read and validated per import chunk
+APPEND_BATCH_SIZE = 500   # rows sent per append_rows call
+REQUIRED_IMPORT_COLUMNS = ["Date", "Description"]
+
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+
+DASHBOARD_PAGE_SIZE = 25  # attendance rows rendered per dashboard page
+
+JOURNAL_PATH = "sb_journal.sqlite3"   # local write-ahead journal of sheet mutations
+JOURNAL_REPLAY_BATCH = 200            # journal entries applied per replay round
+LEDGER_CHECK_EVERY = 10               # replays between whole-ledger checks in the replay harness
+
 # -----------------------------
 # SECRETS
 # -----------------------------
 TELEGRAM_TOKEN = st.secrets["TELEGRAM_TOKEN"]
-CHAT_ID = st.secrets["CHAT_ID"]
+CHAT_ID = st.secrets.get("CHAT_ID", "")
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -34,14 +65,176 @@ SCOPES = [
 ]
 
 # -----------------------------
-# GOOGLE SHEETS AUTH
+# TENANTS
 # -----------------------------
-creds = Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=SCOPES
-)
-gc = gspread.authorize(creds)
-worksheet = gc.open_by_key(SPREADSHEET_ID).sheet1
+# Each squash group gets its own sheet (or SQLite file), chat, fee and
+# opening balance, configured in secrets as [tenants.<id>]. Without a
+# tenants section the single group configured above is served.
+DEFAULT_TENANT_ID = "yck"
+
+def load_tenants() -> dict:
+    defaults = {
+        "name": "Squash Buddies @YCK",
+        "spreadsheet_id": SPREADSHEET_ID,
+        "sqlite_path": "",
+        "chat_id": CHAT_ID,
+        "fee": DEFAULT_FEE,
+        "initial_balance": initial_balance,
+        "paynow": "97333133",
+        "payee": "Seah",
+        "url": "https://tinyurl.com/SquashYCK",
+        "fund_note": "Initial Balance as Feb 2026: -6.00",
+        "journal_path": JOURNAL_PATH,
+        "players_per_court_hour": PLAYERS_PER_COURT_HOUR,
+    }
+    configured = {k: dict(v) for k, v in st.secrets.get("tenants", {}).items()}
+
+    tenants = {}
+    for tenant_id, cfg in (configured or {DEFAULT_TENANT_ID: {}}).items():
+        if tenant_id != DEFAULT_TENANT_ID:
+            # Other groups never fall back to the default group's storage or details
+            cfg.setdefault("name", tenant_id)
+            cfg.setdefault("spreadsheet_id", "")
+            cfg.setdefault("chat_id", "")
+            cfg.setdefault("payee", "")
+            cfg.setdefault("paynow", "")
+            cfg.setdefault("url", "")
+            cfg.setdefault("fund_note", f"Initial Balance: SGD {float(cfg.get('initial_balance', initial_balance)):.2f}")
+            cfg.setdefault("journal_path", f"sb_journal_{tenant_id}.sqlite3")
+        tenant = {**defaults, **cfg, "id": tenant_id}
+        tenant["chat_id"] = str(tenant["chat_id"])
+        tenants[tenant_id] = tenant
+    return tenants
+
+TENANTS = load_tenants()
+
+_tenant_ctx = threading.local()
+
+def use_tenant(tenant_id: str):
+    """Make tenant_id the active group for the current thread"""
+    _tenant_ctx.tenant = TENANTS[tenant_id]
+
+def current_tenant() -> dict:
+    return getattr(_tenant_ctx, "tenant", None) or next(iter(TENANTS.values()))
+
+# -----------------------------
+# STORAGE (shared across sessions)
+# -----------------------------
+@st.cache_resource(show_spinner=False)
+def gspread_client() -> gspread.Client:
+    """One authorized client (and HTTP session) for every tenant"""
+    creds = Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"],
+        scopes=SCOPES
+    )
+    return gspread.authorize(creds)
+
+class SqliteWorksheet:
+    """Local SQLite shard exposing the subset of gspread.Worksheet used here"""
+
+    def __init__(self, path: str):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)"
+        )
+
+    @staticmethod
+    def _cell(v) -> str:
+        if isinstance(v, bool):
+            return "TRUE" if v else "FALSE"
+        if isinstance(v, float) and v.is_integer():
+            return str(int(v))
+        return "" if v is None else str(v)
+
+    def _ids(self) -> list:
+        return [r[0] for r in self.conn.execute("SELECT id FROM rows ORDER BY id")]
+
+    def _set_cells(self, cells):
+        """cells: iterable of (row, col, value), 1-based"""
+        ids = self._ids()
+        by_row = {}
+        for r, c, v in cells:
+            by_row.setdefault(r, []).append((c, v))
+        for r, updates in by_row.items():
+            data = json.loads(self.conn.execute("SELECT data FROM rows WHERE id = ?", (ids[r - 1],)).fetchone()[0])
+            for c, v in updates:
+                data += [""] * (c - len(data))
+                data[c - 1] = self._cell(v)
+            self.conn.execute("UPDATE rows SET data = ? WHERE id = ?", (json.dumps(data), ids[r - 1]))
+
+    def get_all_values(self) -> list:
+        with self.lock:
+            rows = [json.loads(r[0]) for r in self.conn.execute("SELECT data FROM rows ORDER BY id")]
+        # Rectangular like gspread: rows written before a column was added are padded
+        width = max(map(len, rows), default=0)
+        return [r + [""] * (width - len(r)) for r in rows]
+
+    def row_values(self, index: int) -> list:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM rows ORDER BY id LIMIT 1 OFFSET ?", (index - 1,)
+            ).fetchone()
+            return json.loads(row[0]) if row else []
+
+    def append_rows(self, rows, value_input_option=None):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO rows (data) VALUES (?)",
+                [(json.dumps([self._cell(v) for v in row]),) for row in rows]
+            )
+
+    def append_row(self, row, value_input_option=None):
+        self.append_rows([row])
+
+    def insert_row(self, values, index=1):
+        with self.lock, self.conn:
+            rows = [json.loads(r[0]) for r in self.conn.execute("SELECT data FROM rows ORDER BY id")]
+            rows.insert(index - 1, [self._cell(v) for v in values])
+            self.conn.execute("DELETE FROM rows")
+            self.conn.executemany("INSERT INTO rows (data) VALUES (?)", [(json.dumps(r),) for r in rows])
+
+    def update(self, range_name, values, **kwargs):
+        m = re.match(r"([A-Z]+)(\d+)", range_name)
+        col0 = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(m.group(1))))
+        row0 = int(m.group(2))
+        with self.lock, self.conn:
+            missing = row0 + len(values) - 1 - len(self._ids())
+            self.conn.executemany("INSERT INTO rows (data) VALUES ('[]')", [()] * max(0, missing))
+            self._set_cells(
+                (row0 + i, col0 + j, v)
+                for i, row in enumerate(values) for j, v in enumerate(row)
+            )
+
+    def update_cells(self, cells, value_input_option=None):
+        with self.lock, self.conn:
+            self._set_cells((c.row, c.col, c.value) for c in cells)
+
+    def delete_rows(self, index: int):
+        self.apply_batch([], [index])
+
+    def apply_batch(self, cells, delete_indexes):
+        """Set (row, col, value) cells then delete rows, in one transaction"""
+        with self.lock, self.conn:
+            self._set_cells(cells)
+            ids = self._ids()
+            self.conn.executemany(
+                "DELETE FROM rows WHERE id = ?", [(ids[i - 1],) for i in delete_indexes]
+            )
+
+@st.cache_resource(show_spinner=False)
+def open_worksheet(tenant_id: str):
+    """Storage shard for a tenant, opened once per process"""
+    tenant = TENANTS[tenant_id]
+    if tenant["sqlite_path"]:
+        return SqliteWorksheet(tenant["sqlite_path"])
+    return gspread_client().open_by_key(tenant["spreadsheet_id"]).sheet1
+
+def get_worksheet():
+    tenant = current_tenant()
+    return tenant.get("store") or open_worksheet(tenant["id"])
 
 # -----------------------------
 # HELPERS
@@ -55,6 +248,7 @@ def get_next_sundays(n=4):
 
 def ensure_headers():
     """Ensure row 1 matches EXPECTED_COLUMNS"""
+    worksheet = get_worksheet()
     header = worksheet.row_values(1)
     header = [h.strip() for h in header] if header else []
 
@@ -63,33 +257,45 @@ def ensure_headers():
         return
 
     if header != EXPECTED_COLUMNS:
-        worksheet.update("A1:I1", [EXPECTED_COLUMNS])
+        worksheet.update(f"A1:{chr(64 + len(EXPECTED_COLUMNS))}1", [EXPECTED_COLUMNS])
 
 @st.cache_data(ttl=30, show_spinner=False)
-def load_records_cached(cache_bust: int = 0) -> pd.DataFrame:
+def load_records_cached(tenant_id: str, cache_bust: int = 0, version: int = 0) -> pd.DataFrame:
     """Load records from Google Sheet"""
+    use_tenant(tenant_id)
+    return fetch_records()
+
+def fetch_records() -> pd.DataFrame:
+    """Read and normalize all records from Google Sheet (uncached)"""
     ensure_headers()
 
-    values = worksheet.get_all_values()
+    loaded_at = time.time()
+    values = get_worksheet().get_all_values()
     if len(values) <= 1:
         df = pd.DataFrame(columns=EXPECTED_COLUMNS)
         df["_row"] = pd.Series(dtype=int)
+        df.attrs["loaded_at"] = loaded_at
         return df
 
     header = [h.strip() for h in values[0]]
     rows = values[1:]
 
-    df = pd.DataFrame(rows, columns=header)
+    df = normalize_records(pd.DataFrame(rows, columns=header))
 
+    # Track actual sheet row numbers
+    df["_row"] = range(2, 2 + len(df))
+    df.attrs["loaded_at"] = loaded_at
+
+    return df
+
+def normalize_records(df: pd.DataFrame) -> pd.DataFrame:
+    """Apply the sheet schema and type coercion to a raw DataFrame"""
     # Guarantee schema
     for col in EXPECTED_COLUMNS:
         if col not in df.columns:
             df[col] = ""
 
-    df = df[EXPECTED_COLUMNS]
-
-    # Track actual sheet row numbers
-    df["_row"] = range(2, 2 + len(df))
+    df = df[EXPECTED_COLUMNS].copy()
 
     # Type conversions
     df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.date
@@ -106,30 +312,48 @@ def load_records_cached(cache_bust: int = 0) -> pd.DataFrame:
     df["Court"] = pd.to_numeric(df["Court"], errors="coerce")
 
     # Normalize strings
-    for c in ["Player Name", "Time Slot", "Description"]:
+    for c in ["Player Name", "Time Slot", "Description", "Entry ID"]:
         df[c] = df[c].astype(str).replace("nan", "").fillna("").str.strip()
 
     return df
 
+@st.cache_resource(show_spinner=False)
+def data_versions() -> dict:
+    """Per-process write counter per tenant, shared by UI sessions and the bot"""
+    return {}
+
+def data_version() -> int:
+    return data_versions().get(current_tenant()["id"], 0)
+
+def bump_data_version():
+    """Invalidate every cached load of the current tenant after a sheet write"""
+    versions = data_versions()
+    tenant_id = current_tenant()["id"]
+    versions[tenant_id] = versions.get(tenant_id, 0) + 1
+
 def bust_cache():
     st.session_state["_cache_bust"] = st.session_state.get("_cache_bust", 0) + 1
 
 def load_records() -> pd.DataFrame:
-    return load_records_cached(st.session_state.get("_cache_bust", 0))
+    return load_records_cached(current_tenant()["id"], st.session_state.get("_cache_bust", 0), data_version())
 
 def send_telegram_message(message: str):
     """Send message to Telegram"""
+    chat_id = current_tenant()["chat_id"]
+    if not chat_id:
+        st.warning("No Telegram chat is configured for this group")
+        return
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {"chat_id": CHAT_ID, "text": message}
+    payload = {"chat_id": chat_id, "text": message}
     resp = requests.post(url, json=payload, timeout=10)
     if resp.status_code != 200:
         st.error(f"Telegram error: {resp.text}")
 
-def append_record(record: dict):
-    """Append a new record row to Google Sheet"""
+def record_to_row(record: dict) -> list:
+    """Convert a record dict to a sheet row in EXPECTED_COLUMNS order"""
     collection = float(record.get("Collection", 0) or 0)
     expense = float(record.get("Expense", 0) or 0)
-    record["Balance"] = initial_balance + collection - expense
+    record["Balance"] = current_tenant()["initial_balance"] + collection - expense
 
     row = []
     for col in EXPECTED_COLUMNS:
@@ -139,30 +363,67 @@ def append_record(record: dict):
         if val is None:
             val = ""
         row.append(val)
+    return row
 
-    worksheet.append_row(row, value_input_option="USER_ENTERED")
+def append_records(records: list):
+    """Append many record rows to Google Sheet in batched calls"""
+    worksheet = get_worksheet()
+    rows = [record_to_row(r) for r in records]
+    for i in range(0, len(rows), APPEND_BATCH_SIZE):
+        worksheet.append_rows(rows[i:i + APPEND_BATCH_SIZE], value_input_option="USER_ENTERED")
 
-def update_row_cells(sheet_row: int, updates: dict):
-    """Update specific columns for a given row"""
+def header_columns(worksheet) -> dict:
+    """Column name -> 1-based column index from the sheet header"""
     header = [h.strip() for h in worksheet.row_values(1)]
-    col_map = {name: idx + 1 for idx, name in enumerate(header)}
+    return {name: idx + 1 for idx, name in enumerate(header)}
+
+def delete_sheet_rows(row_numbers, updates_by_row=None):
+    """Delete multiple rows, and optionally update others, in one batched write"""
+    worksheet = get_worksheet()
+    rows = sorted({int(x) for x in row_numbers}, reverse=True)
+    updates_by_row = {int(r): u for r, u in (updates_by_row or {}).items() if int(r) not in rows}
+    if not rows and not updates_by_row:
+        return
 
-    cells = []
-    for k, v in updates.items():
-        if k not in col_map:
-            continue
-        col = col_map[k]
-        if isinstance(v, bool):
-            v = "TRUE" if v else "FALSE"
-        cells.append(gspread.Cell(sheet_row, col, v))
+    col_map = header_columns(worksheet) if updates_by_row else {}
+    cells = [
+        (r, col_map[k], v)
+        for r, updates in updates_by_row.items()
+        for k, v in updates.items() if k in col_map
+    ]
 
-    if cells:
-        worksheet.update_cells(cells, value_input_option="USER_ENTERED")
+    if hasattr(worksheet, "apply_batch"):  # SqliteWorksheet (class identity changes across reruns)
+        worksheet.apply_batch(cells, rows)
+        return
 
-def delete_sheet_rows(row_numbers):
-    """Delete multiple rows safely"""
-    for r in sorted([int(x) for x in row_numbers], reverse=True):
-        worksheet.delete_rows(r)
+    def entered(v):
+        if isinstance(v, bool):
+            return {"boolValue": v}
+        if isinstance(v, (int, float)):
+            return {"numberValue": v}
+        return {"stringValue": str(v)}
+
+    # Cell updates use pre-deletion row numbers, so they go first;
+    # deletions then run bottom-up so earlier ones don't shift later ones
+    batch = [
+        {"updateCells": {
+            "range": {
+                "sheetId": worksheet.id,
+                "startRowIndex": r - 1, "endRowIndex": r,
+                "startColumnIndex": c - 1, "endColumnIndex": c,
+            },
+            "rows": [{"values": [{"userEnteredValue": entered(v)}]}],
+            "fields": "userEnteredValue",
+        }}
+        for r, c, v in cells
+    ] + [
+        {"deleteDimension": {"range": {
+            "sheetId": worksheet.id, "dimension": "ROWS",
+            "startIndex": r - 1, "endIndex": r,
+        }}}
+        for r in rows
+    ]
+    worksheet.spreadsheet.batch_update({"requests": batch})
 
 def build_dashboard_message(df: pd.DataFrame, target_date: datetime.date, show_fund=False):
     """Build message identical to dashboard summary"""
@@ -213,10 +474,17 @@ def build_dashboard_message(df: pd.DataFrame, target_date: datetime.date, show_f
 
         lines.append(f"{paid} {name}")
 
+    waitlist = sunday_df[sunday_df["Description"].str.lower() == "waitlist"].sort_values("_row")
+    if not waitlist.empty:
+        lines.append(f"⏳ Waitlist: {len(waitlist)}")
+        for i, name in enumerate(waitlist["Player Name"], 1):
+            lines.append(f"{i}. {name}")
+
     lines.append("")
-    lines.append("Court share @$4")
-    lines.append("Cash or playnow/paylah to 97333133")
-    lines.append("For booking or remove your name please go to https://tinyurl.com/SquashYCK")
+    tenant = current_tenant()
+    lines.append(f"Court share @${tenant['fee']}")
+    lines.append(f"Cash or playnow/paylah to {tenant['paynow']}")
+    lines.append(f"For booking or remove your name please go to {tenant['url']}")
 
     # show fund only when needed
     if show_fund:
@@ -224,11 +492,11 @@ def build_dashboard_message(df: pd.DataFrame, target_date: datetime.date, show_f
         total_collection = pd.to_numeric(df["Collection"], errors="coerce").fillna(0).sum()
         total_expense = pd.to_numeric(df["Expense"], errors="coerce").fillna(0).sum()
 
-        balance = initial_balance + total_collection - total_expense
+        balance = tenant["initial_balance"] + total_collection - total_expense
 
         lines.append("")
         lines.append("💰 Our Fund:")
-        lines.append("Initial Balance as Feb 2026: -6.00")
+        lines.append(tenant["fund_note"])
         lines.append(f"Collection: SGD {total_collection:.2f}")
         lines.append(f"Expense: SGD {total_expense:.2f}")
         lines.append(f"Balance: SGD {balance:.2f}")
@@ -245,87 +513,1157 @@ def next_sunday_of(d: datetime.date) -> datetime.date:
     return d + datetime.timedelta(days=7)
 
 # -----------------------------
-# REMINDER FUNCTION (Based on Google Sheet dates - PREVIOUS SUNDAY with attendance)
+# BULK IMPORT / EXPORT
+# -----------------------------
+def ledger_keys(df: pd.DataFrame) -> pd.Series:
+    """Duplicate-detection key per row (player/date for signups, full entry otherwise)"""
+    date = df["Date"].astype(str)
+    desc = df["Description"].str.lower()
+    player = df["Player Name"].str.lower()
+    is_signup = desc.isin(SIGNUP_DESCRIPTIONS)
+    detail = (
+        "|" + df["Court"].fillna(0).astype(float).astype(str)
+        + "|" + df["Time Slot"]
+        + "|" + df["Collection"].astype(float).astype(str)
+        + "|" + df["Expense"].astype(float).astype(str)
+    )
+    # Attendance and waitlist rows share a key: one signup per player per date
+    key = date + "|" + desc.where(~is_signup, "signup") + "|" + player
+    return key.where(is_signup, key + detail)
+
+def iter_upload_chunks(uploaded, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield raw DataFrames of at most chunk_size rows from a CSV/XLSX upload"""
+    name = getattr(uploaded, "name", str(uploaded)).lower()
+
+    if name.endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(uploaded, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            width = len(header)
+            batch = []
+            for r in rows:
+                r = ["" if v is None else v for v in r[:width]]
+                batch.append(r + [""] * (width - len(r)))
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            wb.close()
+    else:
+        for chunk in pd.read_csv(uploaded, dtype=str, keep_default_na=False, chunksize=chunk_size):
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            yield chunk
+
+def import_records(uploaded, existing_df: pd.DataFrame, chunk_size=IMPORT_CHUNK_SIZE) -> dict:
+    """Stream a CSV/XLSX file into the sheet, skipping invalid and duplicate rows"""
+    seen = set(ledger_keys(existing_df)) if not existing_df.empty else set()
+    summary = {"imported": 0, "duplicates": 0, "rejected": 0}
+
+    for chunk in iter_upload_chunks(uploaded, chunk_size):
+        missing = [c for c in REQUIRED_IMPORT_COLUMNS if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Import file is missing columns: {', '.join(missing)}")
+
+        chunk = normalize_records(chunk)
+
+        is_signup = chunk["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+        valid = chunk["Date"].notna() & (chunk["Description"] != "")
+        valid &= ~is_signup | (chunk["Player Name"] != "")
+        summary["rejected"] += int((~valid).sum())
+        chunk = chunk[valid]
+
+        keys = ledger_keys(chunk)
+        fresh = ~keys.isin(seen) & ~keys.duplicated()
+        summary["duplicates"] += int((~fresh).sum())
+        chunk = chunk[fresh]
+        seen.update(keys[fresh])
+
+        if chunk.empty:
+            continue
+
+        chunk = chunk.astype(object)
+        chunk.loc[chunk["Description"].str.lower() != "attendance", "Paid"] = ""
+        chunk["Court"] = chunk["Court"].where(chunk["Court"].notna(), "")
+        append_records(chunk.to_dict("records"))
+        bump_data_version()
+        stats_cube(current_tenant()["id"]).mark_dirty(chunk["Date"])
+        summary["imported"] += len(chunk)
+
+    return summary
+
+def iter_export_chunks(df: pd.DataFrame, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield CSV text for the ledger in chunks, header first"""
+    out = df[EXPECTED_COLUMNS]
+    for start in range(0, max(len(out), 1), chunk_size):
+        yield out.iloc[start:start + chunk_size].to_csv(index=False, header=start == 0)
+
+def export_records(df: pd.DataFrame, fmt: str = "csv") -> bytes:
+    """Export the ledger as CSV or XLSX bytes"""
+    if fmt == "xlsx":
+        import io
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(EXPECTED_COLUMNS)
+        out = df[EXPECTED_COLUMNS]
+        for start in range(0, len(out), IMPORT_CHUNK_SIZE):
+            chunk = out.iloc[start:start + IMPORT_CHUNK_SIZE].astype(object)
+            for row in chunk.where(chunk.notna(), "").itertuples(index=False):
+                ws.append(list(row))
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    return "".join(iter_export_chunks(df)).encode("utf-8")
+
+# -----------------------------
+# WRITE-AHEAD JOURNAL
+# -----------------------------
+# Every mutation is recorded locally (fsync'd) with an idempotency key before
+# it is sent to the sheet, then replayed in batches until acknowledged.
+# Updates and deletes are matched by date/player at replay time, so a replay
+# after a partial failure never touches the wrong row.
+
+@st.cache_resource(show_spinner=False)
+def journal_lock(tenant_id: str) -> threading.Lock:
+    return threading.Lock()
+
+def journal_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(current_tenant()["journal_path"], timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            acked_at TEXT
+        )"""
+    )
+    # Idempotency: at most one unacknowledged entry per key
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS journal_pending_key "
+        "ON journal(key) WHERE acked_at IS NULL"
+    )
+    return conn
+
+def record_key(record: dict) -> str:
+    """ledger_keys() for a single record dict, without building a DataFrame"""
+    def num(v):
+        v = pd.to_numeric(v, errors="coerce")
+        return str(float(0 if pd.isna(v) else v))
+
+    def text(v):
+        return "" if v is None else str(v).strip()
+
+    date = pd.to_datetime(record.get("Date"), errors="coerce")
+    desc = text(record.get("Description")).lower()
+    is_signup = desc in SIGNUP_DESCRIPTIONS
+    key = f"{date.date() if pd.notna(date) else None}|{'signup' if is_signup else desc}|{text(record.get('Player Name')).lower()}"
+    if is_signup:
+        return key
+    return (
+        f"{key}|{num(record.get('Court'))}|{text(record.get('Time Slot'))}"
+        f"|{num(record.get('Collection'))}|{num(record.get('Expense'))}"
+    )
+
+def match_of(date, player: str, description: str = "Attendance") -> dict:
+    return {"Date": str(date), "Player Name": player.strip(), "Description": description}
+
+def append_entry(record: dict) -> dict:
+    """Journal entry appending a record"""
+    record = {k: (str(v) if isinstance(v, datetime.date) else v) for k, v in record.items()}
+    if str(record.get("Description", "")).lower() in SIGNUP_DESCRIPTIONS:
+        # One signup per player per date, so signups are keyed by content
+        return {"op": "append", "key": "append:" + record_key(record), "payload": {"record": record}}
+    # Bookings and expenses may legitimately repeat; the id is written with the row
+    record["Entry ID"] = uuid.uuid4().hex
+    return {"op": "append", "key": "append:" + record["Entry ID"], "payload": {"record": record}}
+
+def attendance_entry(date, player: str) -> dict:
+    """Journal entry signing a player up for a date"""
+    return append_entry({
+        "Date": date,
+        "Player Name": player.strip(),
+        "Paid": False,
+        "Court": "",
+        "Time Slot": DEFAULT_TIME_SLOT,
+        "Collection": 0,
+        "Expense": 0,
+        "Description": "Attendance",
+    })
+
+def payment_entry(date, player: str) -> dict:
+    """Journal entry marking a player's attendance as paid"""
+    fee = current_tenant()["fee"]
+    return {
+        "op": "update",
+        "key": f"paid:{date}:{player.strip().lower()}",
+        "payload": {
+            "match": match_of(date, player),
+            "updates": {"Paid": True, "Collection": fee, "Balance": fee},
+        },
+    }
+
+def removal_entry(date, player: str, description: str = "Attendance") -> dict:
+    """Journal entry removing a player's attendance (or waitlist place)"""
+    return {
+        "op": "delete",
+        "key": f"delete:{date}:{description.lower()}:{player.strip().lower()}",
+        "payload": {"match": match_of(date, player, description)},
+    }
+
+def journal_submit(entries: list) -> int:
+    """Durably record entries; returns how many were new (not already pending)"""
+    now = datetime.datetime.now().isoformat()
+    with closing(journal_connect()) as conn:
+        with conn:
+            added = 0
+            for e in entries:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO journal (key, op, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (e["key"], e["op"], json.dumps(e["payload"], default=str), now),
+                )
+                added += cur.rowcount
+    return added
+
+def journal_pending_count() -> int:
+    with closing(journal_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM journal WHERE acked_at IS NULL").fetchone()[0]
+
+def _replay_round(limit: int) -> int:
+    """Apply one batch of pending entries; returns how many were acknowledged"""
+    with closing(journal_connect()) as conn:
+        pending = conn.execute(
+            "SELECT id, op, payload FROM journal WHERE acked_at IS NULL ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+    if not pending:
+        return 0
+
+    df = fetch_records()
+    capacity = build_capacity_index(df)
+    booked = {d: e["booked"] for d, e in capacity.items()}
+    court_hours = {d: e["court_hours"] for d, e in capacity.items()}
+
+    is_signup = df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+    # Other appends carry their entry id onto the sheet, so one applied
+    # before a crash (but never acknowledged) is not appended twice
+    others = df[~is_signup]
+    entry_ids = set(others["Entry ID"]) - {""}
+
+    # Hours each court is already held for, per date
+    courts = others[(others["Description"].str.lower() == "court booking") & others["Court"].notna()]
+    court_spans = {}
+    for d, c, slot in zip(courts["Date"], courts["Court"], courts["Time Slot"]):
+        court_spans.setdefault((d, float(c)), set()).update(slot_span(slot))
+
+    signups = df[is_signup]
+    index = {}
+    for d, desc, p, r in zip(signups["Date"].astype(str), signups["Description"].str.lower(),
+                             signups["Player Name"].str.lower(), signups["_row"]):
+        index.setdefault((d, desc, p), []).append(int(r))
+
+    def find_row(match):
+        key = (match["Date"], match["Description"].lower(), match["Player Name"].lower())
+        return next((r for r in index.get(key, []) if r not in deletes), None)
+
+    def signed_up(date, player):
+        return any(find_row(match_of(date, player, d)) is not None for d in SIGNUP_DESCRIPTIONS)
+
+    cells, deletes, appends, added, done = {}, set(), [], set(), []
+    new_waitlist, touched_dates = {}, set()
+    for entry_id, op, payload in pending:
+        p = json.loads(payload)
+        if op == "append":
+            rec = p["record"]
+            date = pd.to_datetime(rec["Date"]).date()
+            desc = str(rec.get("Description", "")).lower()
+            if desc in SIGNUP_DESCRIPTIONS:
+                k = (str(rec["Date"]), str(rec["Player Name"]).lower())
+                if signed_up(*k) or k in added:
+                    done.append(entry_id)
+                    continue
+                added.add(k)
+                # Capacity is enforced here, where writes are serialized
+                cap = seats_for(court_hours.get(date, 0))
+                if cap is not None and booked.get(date, 0) >= cap:
+                    rec = {**rec, "Description": "Waitlist"}
+                    new_waitlist.setdefault(date, []).append(rec)
+                else:
+                    rec = {**rec, "Description": "Attendance"}
+                    booked[date] = booked.get(date, 0) + 1
+            elif rec.get("Entry ID"):
+                if rec["Entry ID"] in entry_ids:
+                    done.append(entry_id)
+                    continue
+                entry_ids.add(rec["Entry ID"])
+            if desc == "court booking":
+                # A court can't be booked twice for the same hour (stale clients may try)
+                span = slot_span(rec.get("Time Slot", ""))
+                held = court_spans.setdefault((date, float(pd.to_numeric(rec.get("Court"), errors="coerce"))), set())
+                if held & span:
+                    done.append(entry_id)
+                    continue
+                held |= span
+                court_hours[date] = court_hours.get(date, 0) + slot_hours(rec.get("Time Slot", ""))
+                touched_dates.add(date)
+            appends.append(rec)
+        else:
+            m = p["match"]
+            row = find_row(m)
+            if row is None and (m["Date"], m["Player Name"].lower()) in added:
+                break  # targets a row appended in this round; apply it next round
+            if row is not None and op == "update":
+                cells.setdefault(row, {}).update(p["updates"])
+            elif row is not None and op == "delete":
+                deletes.add(row)
+                cells.pop(row, None)
+                if m["Description"].lower() == "attendance":
+                    date = pd.to_datetime(m["Date"]).date()
+                    booked[date] = booked.get(date, 0) - 1
+                    touched_dates.add(date)
+        done.append(entry_id)
+
+    # Promote waitlisted players into seats freed (or added) this round
+    for date in touched_dates:
+        cap = seats_for(court_hours.get(date, 0))
+        queue = [r for r, _ in capacity.get(date, {}).get("waitlist", []) if r not in deletes]
+        queue += new_waitlist.get(date, [])
+        for item in queue:
+            if cap is not None and booked.get(date, 0) >= cap:
+                break
+            if isinstance(item, dict):
+                item["Description"] = "Attendance"
+            else:
+                cells.setdefault(item, {})["Description"] = "Attendance"
+            booked[date] = booked.get(date, 0) + 1
+
+    delete_sheet_rows(deletes, cells)
+    append_records(appends)
+
+    touched = [json.loads(payload) for entry_id, _, payload in pending if entry_id in done]
+    bump_data_version()
+    stats_cube(current_tenant()["id"]).mark_dirty(p["record"]["Date"] if "record" in p else p["match"]["Date"] for p in touched)
+
+    now = datetime.datetime.now().isoformat()
+    with closing(journal_connect()) as conn:
+        with conn:
+            conn.executemany(
+                "UPDATE journal SET acked_at = ? WHERE id = ?",
+                [(now, i) for i in done]
+            )
+    return len(done)
+
+def replay_journal(limit=JOURNAL_REPLAY_BATCH) -> int:
+    """Apply all pending journal entries to the sheet in batches"""
+    total = 0
+    with journal_lock(current_tenant()["id"]):
+        while True:
+            n = _replay_round(limit)
+            if not n:
+                return total
+            total += n
+
+def submit_mutations(entries: list) -> bool:
+    """Journal entries and try to apply them; False if left pending for retry"""
+    journal_submit(entries)
+    try:
+        replay_journal()
+        return True
+    except Exception as e:
+        st.warning(f"Saved locally, the sheet will be updated on retry ({e})")
+        return False
+
+# -----------------------------
+# STATS CUBE
+# -----------------------------
+def slot_hours(slot: str) -> float:
+    """Length in hours of a time slot label like '2–4pm'"""
+    return float(len(slot_span(slot)))
+
+def aggregate_dates(df: pd.DataFrame):
+    """Per-Sunday and per-player-per-Sunday aggregates for the dates in df"""
+    df = df[df["Date"].notna()].reset_index(drop=True)
+    desc = df["Description"].str.lower()
+
+    att = df[(desc == "attendance") & (df["Player Name"] != "")].copy()
+    att["player_key"] = att["Player Name"].str.lower()
+    att = att.drop_duplicates(subset=["Date", "player_key"], keep="first")
+    att["unpaid"] = (~att["Paid"].astype(bool)).astype(int)
+
+    # Attendance is already unique per (Date, player), so no groupby is needed here
+    by_player_date = att.set_index(["Date", "player_key"])[["Player Name", "unpaid", "Collection"]].rename(
+        columns={"Player Name": "player", "Collection": "collection"}
+    ).astype({"unpaid": int, "collection": float}).sort_index()
+    fee = current_tenant()["fee"]
+    by_player_date["outstanding"] = by_player_date["unpaid"] * fee
+
+    # One groupby over per-row contributions
+    is_court = desc == "court booking"
+    parts = pd.DataFrame({
+        "Date": df["Date"],
+        "attendance": 0,
+        "unpaid": 0,
+        "collection": df["Collection"],
+        "expense": df["Expense"],
+        "court_hours": 0.0,
+        "court_cost": df["Expense"].where(is_court, 0),
+    })
+    parts.loc[att.index, "attendance"] = 1
+    parts.loc[att.index, "unpaid"] = att["unpaid"]
+    parts.loc[is_court, "court_hours"] = df.loc[is_court, "Time Slot"].map(slot_hours).astype(float)
+
+    by_date = parts.groupby("Date").sum().astype(float).astype({"attendance": int, "unpaid": int})
+    by_date["outstanding"] = by_date["unpaid"] * fee
+    return by_date, by_player_date
+
+def _with_cost_per_head(t: pd.DataFrame) -> pd.DataFrame:
+    t["cost_per_head"] = (t["court_cost"] / t["attendance"].where(t["attendance"] > 0)).round(2)
+    return t
+
+def date_fingerprints(df: pd.DataFrame) -> dict:
+    """Cheap hash per date of the rows aggregate_dates reads (one groupby)"""
+    rows = df[df["Date"].notna()]
+    cols = ["Player Name", "Paid", "Time Slot", "Collection", "Expense", "Description"]
+    hashes = pd.util.hash_pandas_object(rows[cols], index=False)
+    return hashes.groupby(rows["Date"]).sum().to_dict()
+
+class StatsCube:
+    """Attendance and fund aggregates, recomputed only for dates touched since the last sync"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_date = None
+        self.by_player_date = None
+        self.dirty = {}  # date -> time it was marked
+        self.fingerprints = {}  # date -> date_fingerprints() value at the last sync
+
+    def mark_dirty(self, dates):
+        now = time.time()
+        with self.lock:
+            for d in dates:
+                d = pd.to_datetime(d, errors="coerce")
+                if pd.notna(d):
+                    self.dirty[d.date()] = now
+
+    def invalidate(self):
+        with self.lock:
+            self.by_date = self.by_player_date = None
+            self.dirty.clear()
+            self.fingerprints = {}
+
+    def sync(self, df: pd.DataFrame):
+        """Bring the aggregates up to date with df"""
+        loaded_at = df.attrs.get("loaded_at", 0)
+        fingerprints = date_fingerprints(df)
+        with self.lock:
+            if self.by_date is None:
+                self.by_date, self.by_player_date = aggregate_dates(df)
+                self.dirty = {d: t for d, t in self.dirty.items() if t >= loaded_at}
+                self.fingerprints = fingerprints
+                return
+
+            # Dates changed outside this process (e.g. edited in the sheet) are
+            # caught by their fingerprint; in-process writes also mark_dirty
+            previous, self.fingerprints = self.fingerprints, fingerprints
+            dates = set(self.dirty) | {
+                d for d in previous.keys() | fingerprints.keys() if previous.get(d) != fingerprints.get(d)
+            }
+            if not dates:
+                return
+
+            by_date, by_player_date = aggregate_dates(df[df["Date"].isin(dates)])
+            keep = ~self.by_date.index.isin(dates)
+            self.by_date = pd.concat([self.by_date[keep], by_date]).sort_index()
+            keep = ~self.by_player_date.index.get_level_values("Date").isin(dates)
+            self.by_player_date = pd.concat([self.by_player_date[keep], by_player_date]).sort_index()
+
+            # Dates marked after df was loaded may not be reflected in it yet
+            self.dirty = {d: t for d, t in self.dirty.items() if t >= loaded_at}
+
+    def sundays(self) -> pd.DataFrame:
+        return _with_cost_per_head(self.by_date.copy()).sort_index(ascending=False)
+
+    def months(self) -> pd.DataFrame:
+        t = self.by_date.copy()
+        t.index = pd.to_datetime(t.index).to_period("M").astype(str)
+        return _with_cost_per_head(t.groupby(level=0).sum()).sort_index(ascending=False)
+
+    def players(self) -> pd.DataFrame:
+        t = self.by_player_date.reset_index()
+        return t.groupby("player_key").agg(
+            player=("player", "last"),
+            sessions=("Date", "size"),
+            unpaid=("unpaid", "sum"),
+            outstanding=("outstanding", "sum"),
+            collection=("collection", "sum"),
+            last_played=("Date", "max"),
+        ).set_index("player").sort_values(["sessions", "outstanding"], ascending=False)
+
+@st.cache_resource(show_spinner=False)
+def stats_cube(tenant_id: str) -> StatsCube:
+    return StatsCube()
+
+# -----------------------------
+# COURT PLANNER
+# -----------------------------
+def slot_span(slot: str) -> frozenset:
+    """Start hours covered by a time slot label, e.g. '2–4pm' -> {2, 3}"""
+    m = re.search(r"(\d+)\s*[–-]\s*(\d+)", str(slot))
+    return frozenset(range(int(m.group(1)), int(m.group(2)))) if m else frozenset()
+
+def court_patterns(prices: dict) -> list:
+    """Every set of non-overlapping slots one court can be booked for"""
+    slots = list(prices)
+    patterns = []
+    for n in range(len(slots) + 1):
+        for combo in itertools.combinations(slots, n):
+            spans = [slot_span(s) for s in combo]
+            if sum(len(x) for x in spans) == len(frozenset().union(*spans)):
+                patterns.append(combo)
+    return patterns
+
+def plan_courts(signups: int, booked: list, target=PLAYERS_PER_COURT_HOUR,
+                prices=COURT_SLOT_PRICES, courts=COURT_NUMBERS) -> dict:
+    """Cheapest extra court/slot bookings so court-hours cover signups / target.
+
+    booked is a list of (court, slot) already booked for the date. Solved
+    exactly by dynamic programming over courts, with coverage as the state.
+    """
+    booked_hours = sum(len(slot_span(slot)) for _, slot in booked)
+    need = max(0, math.ceil(signups / target) - booked_hours) if target > 0 else 0
+
+    occupied = {}
+    for court, slot in booked:
+        if pd.notna(court):
+            occupied[int(court)] = occupied.get(int(court), frozenset()) | slot_span(slot)
+
+    patterns = court_patterns(prices)
+    # state: hours covered so far (capped at need) -> (cost, bookings, chosen);
+    # ties go to the lowest court numbers
+    states = {0: (0, 0, ())}
+    for court in courts:
+        taken = occupied.get(court, frozenset())
+        options = [p for p in patterns if not any(slot_span(s) & taken for s in p)]
+        nxt = {}
+        for covered, (cost, n, chosen) in states.items():
+            for p in options:
+                c = min(need, covered + sum(len(slot_span(s)) for s in p))
+                cand = (cost + sum(prices[s] for s in p), n + len(p), chosen + tuple((court, s) for s in p))
+                if c not in nxt or cand < nxt[c]:
+                    nxt[c] = cand
+        states = nxt
+
+    covered = max(states)
+    cost, _, chosen = states[covered]
+    return {
+        "need_hours": need,
+        "booked_hours": booked_hours,
+        "bookings": list(chosen),
+        "cost": cost,
+        "shortfall_hours": need - covered,
+    }
+
+def plan_upcoming_courts(df: pd.DataFrame, sundays: list, target=PLAYERS_PER_COURT_HOUR) -> dict:
+    """plan_courts() for each Sunday from its signups and existing court bookings"""
+    sub = df[df["Date"].isin(sundays)]
+    desc = sub["Description"].str.lower()
+    att = sub[desc.isin(SIGNUP_DESCRIPTIONS) & (sub["Player Name"] != "")]
+    signups = att.assign(k=att["Player Name"].str.lower()).drop_duplicates(["Date", "k"]).groupby("Date").size()
+    courts = sub[desc == "court booking"]
+
+    plans = {}
+    for d in sundays:
+        c = courts[courts["Date"] == d]
+        plans[d] = plan_courts(int(signups.get(d, 0)), list(zip(c["Court"], c["Time Slot"])), target)
+        plans[d]["signups"] = int(signups.get(d, 0))
+    return plans
+
+# -----------------------------
+# CAPACITY & WAITLIST
+# -----------------------------
+# A Sunday's capacity is its booked court-hours times the players-per-court-hour
+# target. Sundays with no court booked yet take unlimited signups. Signups past
+# capacity are stored as "Waitlist" rows and promoted in sheet order.
+SIGNUP_DESCRIPTIONS = ("attendance", "waitlist")
+
+def seats_for(court_hours: float):
+    """Player capacity for the given court-hours, or None when no court is booked"""
+    if not court_hours:
+        return None
+    return int(court_hours * current_tenant()["players_per_court_hour"])
+
+def build_capacity_index(df: pd.DataFrame) -> dict:
+    """date -> court hours, capacity, booked count and ordered waitlist [(row, name)]"""
+    df = df[df["Date"].notna()]
+    desc = df["Description"].str.lower()
+
+    att = df[(desc == "attendance") & (df["Player Name"] != "")]
+    booked = att.assign(k=att["Player Name"].str.lower()).drop_duplicates(["Date", "k"]).groupby("Date").size()
+    courts = df[desc == "court booking"]
+    hours = courts["Time Slot"].map(slot_hours).groupby(courts["Date"]).sum()
+    waiting = df[desc == "waitlist"].sort_values("_row")
+
+    index = {}
+    for d in set(booked.index) | set(hours.index) | set(waiting["Date"]):
+        h = float(hours.get(d, 0))
+        index[d] = {"court_hours": h, "capacity": seats_for(h), "booked": int(booked.get(d, 0)), "waitlist": []}
+    for d, r, name in zip(waiting["Date"], waiting["_row"], waiting["Player Name"]):
+        index[d]["waitlist"].append((int(r), name))
+    return index
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_capacity_index(tenant_id: str, cache_bust: int = 0, version: int = 0) -> dict:
+    use_tenant(tenant_id)
+    return build_capacity_index(load_records_cached(tenant_id, cache_bust, version))
+
+def has_space(capacity_index: dict, date: datetime.date) -> bool:
+    """O(1) check whether a new signup for date gets a seat"""
+    entry = capacity_index.get(date)
+    return entry is None or entry["capacity"] is None or entry["booked"] < entry["capacity"]
+
 # -----------------------------
+# REMINDER FUNCTION (Outstanding debts across all past Sundays)
+# -----------------------------
+def last_sunday_on_or_before(d: datetime.date) -> datetime.date:
+    return d - datetime.timedelta(days=(d.weekday() + 1) % 7)
+
+def compute_outstanding_debts(df: pd.DataFrame, as_of: datetime.date) -> pd.DataFrame:
+    """Each player's unpaid sessions up to as_of, in one groupby over the ledger"""
+    att = df[
+        (df["Description"].str.lower() == "attendance") &
+        (df["Player Name"] != "") &
+        df["Date"].notna()
+    ].copy()
+    att = att[att["Date"] <= as_of]
+    att["player_key"] = att["Player Name"].str.lower()
+    att = att.drop_duplicates(subset=["Date", "player_key"], keep="first")
+
+    unpaid = att[~att["Paid"].astype(bool)].sort_values("Date")
+    debts = unpaid.groupby("player_key").agg(
+        player=("Player Name", "first"),
+        dates=("Date", list),
+        sessions=("Date", "size"),
+    )
+    debts["amount"] = debts["sessions"] * current_tenant()["fee"]
+    return debts.sort_index()
+
+def build_debt_reminder_messages(debts: pd.DataFrame, as_of: datetime.date,
+                                 limit=TELEGRAM_MAX_MESSAGE_LEN) -> list:
+    """Combined debtor list split into pages that fit Telegram's message limit"""
+    tenant = current_tenant()
+    header = f"📅 As of {as_of.strftime('%d %b %Y')}\n⚠️ Outstanding court share (${tenant['fee']} per session):"
+    footer = (
+        f"\nTotal outstanding: SGD {debts['amount'].sum():.2f}"
+        f"\n💳 PayNow/PayLah to {tenant['paynow']} \nIf you have paid please go to "
+        f"{tenant['url']} and update Mark Payment"
+    )
+    lines = [
+        f"• {r.player}: SGD {r.amount:.2f} ({', '.join(d.strftime('%d %b %y') for d in r.dates)})"
+        for r in debts.itertuples()
+    ]
+
+    room = limit - len(header) - len(footer) - 16  # 16 chars reserved for the page marker
+    pages, current, size = [], [], 0
+    for line in lines:
+        line = line[:room]
+        if current and size + len(line) + 1 > room:
+            pages.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    pages.append(current)
+
+    messages = []
+    for i, page_lines in enumerate(pages, 1):
+        marker = f" ({i}/{len(pages)})" if len(pages) > 1 else ""
+        body = "\n".join([header + marker] + page_lines)
+        messages.append(body + footer if i == len(pages) else body)
+    return messages
+
 def send_unpaid_reminder():
-    """Send reminder for unpaid players from the PREVIOUS Sunday that had attendance"""
+    """Send one combined reminder of every player's unpaid sessions up to the last Sunday"""
     try:
         # Load fresh data
-        creds = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
-        gc = gspread.authorize(creds)
-        worksheet = gc.open_by_key(SPREADSHEET_ID).sheet1
-
-        values = worksheet.get_all_values()
-        if len(values) <= 1:
-            return False
-            
-        df = pd.DataFrame(values[1:], columns=values[0])
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.date
-        df["Paid"] = df["Paid"].str.lower().isin(["true", "1", "yes", "y"])
-        
-        # Get today's date
-        today = datetime.date.today()
-        
-        # Calculate the most recent Sunday that has passed
-        days_since_sunday = (today.weekday() + 1) % 7
-        last_sunday_calendar = today - datetime.timedelta(days=days_since_sunday)
-        
-        # Get all Sundays that have attendance records
-        attendance_sundays = df[
-            (df["Description"].str.lower().str.strip() == "attendance") &
-            (df["Player Name"].str.strip() != "")
-        ]["Date"].dropna().unique()
-        
-        # Filter to only Sundays that are on or before last Sunday
-        past_sundays = [d for d in attendance_sundays if d <= last_sunday_calendar]
-        
-        if not past_sundays:
-            # No past Sundays with attendance
-            message = "No attendance records found from previous Sundays."
-            send_telegram_message(message)
-            return False
-        
-        # Get the most recent Sunday with attendance
-        last_sunday_with_attendance = sorted(past_sundays, reverse=True)[0]
-        
-        st.info(f"Most recent Sunday with attendance: {last_sunday_with_attendance}")
-
-        # Find unpaid players for that Sunday
-        unpaid = df[
-            (df["Description"].str.lower().str.strip() == "attendance") &
-            (df["Date"] == last_sunday_with_attendance) &
-            (df["Paid"] == False) &
-            (df["Player Name"].str.strip() != "")
-        ].copy()
+        df = fetch_records()
+        as_of = last_sunday_on_or_before(datetime.date.today())
 
-        # sort alphabetically by player name
-        unpaid = unpaid.sort_values(
-            by="Player Name",
-            key=lambda col: col.str.lower()
-        )
+        debts = compute_outstanding_debts(df, as_of)
 
-        if unpaid.empty:
-            message = f"📅 {last_sunday_with_attendance.strftime('%d %b %Y')}\n✅ All players have paid! No reminders needed."
+        if debts.empty:
+            send_telegram_message(
+                f"📅 As of {as_of.strftime('%d %b %Y')}\n✅ All players have paid! No reminders needed."
+            )
         else:
-            names = unpaid["Player Name"].tolist()
-            message = f"📅 {last_sunday_with_attendance.strftime('%d %b %Y')}\n⚠️ Unpaid players (please settle $4):\n"
-            for n in names:
-                message += f"• {n}\n"
-            message += "\n💳 PayNow/PayLah to 97333133 \nIf you have paid please go to https://tinyurl.com/SquashYCK and update Mark Payment"
-
-        send_telegram_message(message)
+            for message in build_debt_reminder_messages(debts, as_of):
+                send_telegram_message(message)
         return True
-        
+
     except Exception as e:
         print(f"Error in reminder: {str(e)}")
         return False
+
+# -----------------------------
+# LEDGER REPLAY HARNESS
+# -----------------------------
+# Replays journal history or randomized multi-client operation sequences
+# against an in-memory SqliteWorksheet through the real write path, checking
+# ledger invariants as it goes. Nothing touches the group's real sheet.
+@contextmanager
+def replay_sandbox():
+    """Run the current group's logic against a throwaway in-memory store"""
+    previous = getattr(_tenant_ctx, "tenant", None)
+    base = current_tenant()
+    with tempfile.TemporaryDirectory() as tmp:
+        _tenant_ctx.tenant = {
+            **base,
+            "id": f"{base['id']}:replay",
+            "store": SqliteWorksheet(":memory:"),
+            "journal_path": os.path.join(tmp, "journal.sqlite3"),
+        }
+        stats_cube(current_tenant()["id"]).invalidate()
+        try:
+            yield
+        finally:
+            _tenant_ctx.tenant = previous
+
+def ledger_tuples(df: pd.DataFrame) -> list:
+    """Rows as comparable tuples (numbers as floats, a missing court as 0.0)"""
+    cols = ["Date", "Player Name", "Paid", "Court", "Time Slot", "Collection", "Expense", "Description", "Entry ID"]
+    return [
+        (str(d), p, bool(paid), 0.0 if pd.isna(court) else float(court), slot, float(c), float(e), desc, entry_id)
+        for d, p, paid, court, slot, c, e, desc, entry_id in zip(*(df[col] for col in cols))
+    ]
+
+def signup_state(df: pd.DataFrame) -> dict:
+    """(date, player) -> [description, paid] for every signup row"""
+    s = df[df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)]
+    return {
+        (str(d), p.lower()): [desc.lower(), bool(paid)]
+        for d, p, desc, paid in zip(s["Date"], s["Player Name"], s["Description"], s["Paid"])
+    }
+
+def check_replay_effects(before: pd.DataFrame, after: pd.DataFrame, entries: list) -> list:
+    """Compare one replay with a pure-Python model of what its entries should
+    do: each update or delete changes its own (date, player) signup and no
+    other, and bookings/expenses only ever gain the rows appended"""
+    model, unsure, appended_ids = signup_state(before), set(), set()
+    for e in entries:
+        p = e["payload"]
+        rec = p.get("record") or p["match"]
+        key = (str(rec["Date"]), str(rec.get("Player Name", "")).strip().lower())
+        desc = str(rec.get("Description", "")).lower()
+        if e["op"] == "append" and desc not in SIGNUP_DESCRIPTIONS:
+            appended_ids.add(rec.get("Entry ID", ""))
+        elif key in unsure:
+            continue
+        elif e["op"] == "append":
+            model.setdefault(key, [None, False])  # capacity decides attendance or waitlist
+        elif key not in model:
+            continue
+        elif e["op"] == "update":
+            if model[key][0] == "attendance":
+                model[key][1] = True
+            else:
+                unsure.add(key)  # applies only if the player was promoted by then
+        elif model[key][0] == desc == "attendance":
+            del model[key]
+        elif not (model[key][0] == "attendance" and desc == "waitlist"):
+            unsure.add(key)  # a waitlisted player may have been promoted first
+
+    problems = []
+    actual, existed = signup_state(after), signup_state(before)
+    for key in sorted((model.keys() | actual.keys()) - unsure):
+        d, player = key
+        if key not in actual:
+            problems.append(f"{d} {player}: " + ("removed without an entry" if key in existed else "signup not applied"))
+        elif key not in model:
+            problems.append(f"{d} {player}: " + ("removal not applied" if key in existed else "signup appeared without an entry"))
+        else:
+            (want_desc, want_paid), (desc, paid) = model[key], actual[key]
+            if paid != want_paid:
+                problems.append(f"{d} {player}: paid is {paid}, expected {want_paid}")
+            if want_desc == "attendance" and desc != "attendance":
+                problems.append(f"{d} {player}: moved from attendance to {desc}")
+
+    is_signup = before["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+    old = collections.Counter(ledger_tuples(before[~is_signup]))
+    is_signup = after["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+    new = collections.Counter(ledger_tuples(after[~is_signup]))
+    if old - new:
+        problems.append(f"{sum((old - new).values())} bookings/expenses changed or removed")
+    stray = [t for t in (new - old).elements() if t[-1] not in appended_ids]
+    if stray:
+        problems.append(f"{len(stray)} bookings/expenses appeared without an entry")
+    return problems
+
+def replay_and_check(before: pd.DataFrame) -> tuple:
+    """replay_journal() checked against its pending entries; returns (records after, problems)"""
+    with closing(journal_connect()) as conn:
+        pending = conn.execute("SELECT op, payload FROM journal WHERE acked_at IS NULL ORDER BY id").fetchall()
+    replay_journal()
+    after = fetch_records()
+    entries = [{"op": op, "payload": json.loads(p)} for op, p in pending]
+    return after, check_replay_effects(before, after, entries)
+
+def check_ledger_invariants(df: pd.DataFrame) -> list:
+    """Violations of the ledger invariants in df (empty list when consistent)"""
+    tenant = current_tenant()
+    problems = []
+
+    # No player is signed up twice for the same Sunday
+    is_signup = df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+    signups = df[is_signup]
+    dupes = signups.assign(k=signups["Player Name"].str.lower()).duplicated(["Date", "k"])
+    if dupes.any():
+        problems.append(f"{int(dupes.sum())} duplicate signups")
+
+    # No journal entry is written twice
+    ids = df.loc[~is_signup, "Entry ID"]
+    dupes = ids[ids != ""].duplicated()
+    if dupes.any():
+        problems.append(f"{int(dupes.sum())} entries written twice")
+
+    # No court is booked twice for the same hour
+    courts = df[(df["Description"].str.lower() == "court booking") & df["Court"].notna()]
+    for (d, court), slots in courts.groupby(["Date", "Court"])["Time Slot"]:
+        spans = [slot_span(s) for s in slots]
+        if sum(len(x) for x in spans) != len(frozenset().union(*spans)):
+            problems.append(f"{d}: court {int(court)} booked twice for the same hour")
+
+    # Collections come only from paid attendance, one fee each
+    att = df[df["Description"].str.lower() == "attendance"]
+    if df["Collection"].sum() != tenant["fee"] * int(att["Paid"].sum()):
+        problems.append("collections differ from fee x paid attendance")
+
+    # Incremental aggregates agree with a full rebuild
+    cube = stats_cube(tenant["id"])
+    cube.sync(df)
+    fresh = StatsCube()
+    fresh.sync(df)
+    if not cube.sundays().equals(fresh.sundays()) or not cube.players().equals(fresh.players()):
+        problems.append("incremental stats differ from a full rebuild")
+
+    # The fund balance posted to the chat matches the stored amounts
+    values = get_worksheet().get_all_values()
+    stored = pd.DataFrame(values[1:], columns=values[0])[["Collection", "Expense"]]
+    stored = stored.apply(pd.to_numeric, errors="coerce").fillna(0).sum()
+    expected = tenant["initial_balance"] + stored["Collection"] - stored["Expense"]
+    message = build_dashboard_message(df, datetime.date.today(), show_fund=True)
+    shown = float(re.search(r"Balance: SGD (-?[\d.]+)", message).group(1))
+    if abs(shown - expected) > 0.005:
+        problems.append(f"fund balance shows {shown:.2f}, expected {expected:.2f}")
+
+    # Nobody waits while seats are free (players who signed up before courts
+    # were booked may legitimately leave a Sunday over capacity)
+    for d, e in build_capacity_index(df).items():
+        if e["waitlist"] and has_space({d: e}, d):
+            problems.append(f"{d}: waitlist with free seats")
+
+    if journal_pending_count():
+        problems.append("journal entries left unacknowledged")
+    return problems
+
+def random_operations(rng: random.Random, snapshot: pd.DataFrame, sundays: list) -> list:
+    """Journal entries one client would submit from its (possibly stale) snapshot"""
+    kind = rng.choice(["join", "join", "join", "leave", "pay", "court", "expense"])
+    date = rng.choice(sundays)
+    signups = snapshot[
+        snapshot["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS) & (snapshot["Date"] == date)
+    ]
+
+    if kind == "leave" and not signups.empty:
+        r = signups.iloc[rng.randrange(len(signups))]
+        return [removal_entry(date, r["Player Name"], r["Description"])]
+    if kind == "pay":
+        unpaid = signups[(signups["Description"].str.lower() == "attendance") & (~signups["Paid"])]
+        if not unpaid.empty:
+            name = unpaid.iloc[rng.randrange(len(unpaid))]["Player Name"]
+            return [payment_entry(date, name), attendance_entry(next_sunday_of(date), name)]
+    if kind == "court":
+        slot = rng.choice(list(COURT_SLOT_PRICES))
+        return [append_entry({
+            "Date": date, "Court": rng.choice(COURT_NUMBERS), "Time Slot": slot,
+            "Expense": COURT_SLOT_PRICES[slot], "Description": "Court booking",
+        })]
+    if kind == "expense":
+        return [append_entry({
+            "Date": date, "Expense": rng.choice([5, 10.5, 20]),
+            "Description": f"Balls #{rng.randrange(1000)}",
+        })]
+    return [attendance_entry(date, rng.choice(["Alex", "bea", "Chen", "Dev", "Eli", "Fay", "Gus", "Hana"]))]
+
+def run_random_ledger_check(seed: int = 0, steps: int = 200, clients: int = 3) -> dict:
+    """Interleave operations from several clients with stale snapshots and check invariants"""
+    rng = random.Random(seed)
+    sundays = [datetime.date(2026, 1, 4) + datetime.timedelta(weeks=i) for i in range(3)]
+    started = time.perf_counter()
+    problems = []
+
+    with replay_sandbox():
+        # The sheet only changes on replay, so the latest replay's records are current
+        df = fetch_records()
+        snapshots = [df] * clients
+        replays = 0
+        for step in range(steps):
+            c = rng.randrange(clients)
+            if rng.random() < 0.3:
+                snapshots[c] = df
+            journal_submit(random_operations(rng, snapshots[c], sundays))
+
+            # Let writes pile up sometimes so replays batch several clients
+            if not (rng.random() < 0.5 or step == steps - 1):
+                continue
+            df, found = replay_and_check(df)
+            if rng.random() < 0.1:
+                # Lose the last round's acks, as if the process died just after writing
+                with closing(journal_connect()) as conn, conn:
+                    conn.execute(
+                        "UPDATE journal SET acked_at = NULL"
+                        " WHERE acked_at = (SELECT MAX(acked_at) FROM journal)"
+                    )
+                df, more = replay_and_check(df)
+                found += more
+            problems += [f"step {step}: {p}" for p in found]
+
+            # Whole-ledger checks (stats rebuild, reminders) are the slow part
+            replays += 1
+            if replays % LEDGER_CHECK_EVERY and step != steps - 1:
+                continue
+            problems += [f"step {step}: {p}" for p in check_ledger_invariants(df)]
+
+            as_of = max(sundays)
+            debts = compute_outstanding_debts(df, as_of)
+            if not debts.empty:
+                messages = build_debt_reminder_messages(debts, as_of)
+                if any(len(m) > TELEGRAM_MAX_MESSAGE_LEN for m in messages):
+                    problems.append(f"step {step}: reminder page over the Telegram limit")
+
+        rows = len(df)
+
+    elapsed = time.perf_counter() - started
+    return {"steps": steps, "rows": rows, "seconds": round(elapsed, 2), "violations": problems}
+
+def journal_rows(df: pd.DataFrame, players: set, entry_ids: set) -> collections.Counter:
+    """Rows of df the journal accounts for: signups of the given (date, player)
+    pairs and entries with the given ids, as comparable tuples"""
+    is_signup = df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)
+    pairs = zip(df["Date"].astype(str), df["Player Name"].str.lower())
+    ours = [
+        (pair in players) if signup else (entry_id in entry_ids)
+        for pair, signup, entry_id in zip(pairs, is_signup, df["Entry ID"])
+    ]
+    return collections.Counter(ledger_tuples(df[ours]))
+
+def replay_journal_history() -> dict:
+    """Replay every applied entry of the group's journal into a sandbox, check
+    invariants, and compare the result with the group's real sheet"""
+    with closing(journal_connect()) as conn:
+        history = conn.execute(
+            "SELECT key, op, payload FROM journal WHERE acked_at IS NOT NULL ORDER BY id"
+        ).fetchall()
+    sheet = fetch_records()
+
+    started = time.perf_counter()
+    problems = []
+    players, entry_ids = set(), set()
+    with replay_sandbox():
+        batch, keys, count, flushes = [], set(), 0, [0]
+
+        def flush(last=False):
+            journal_submit(batch)
+            df, found = replay_and_check(fetch_records())
+            flushes[0] += 1
+            if last or not flushes[0] % LEDGER_CHECK_EVERY:
+                found += check_ledger_invariants(df)
+            problems.extend(f"entry {count}: {p}" for p in found)
+            batch.clear()
+            keys.clear()
+
+        for key, op, payload in history:
+            # Keys are only unique among pending entries, so a key seen again
+            # (join, leave, join) must wait until the earlier one is applied
+            if key in keys or len(batch) >= JOURNAL_REPLAY_BATCH:
+                flush()
+            p = json.loads(payload)
+            rec = p.get("record") or p["match"]
+            if str(rec.get("Description", "")).lower() in SIGNUP_DESCRIPTIONS:
+                players.add((str(rec["Date"]), str(rec.get("Player Name", "")).strip().lower()))
+            elif rec.get("Entry ID"):
+                entry_ids.add(rec["Entry ID"])
+            batch.append({"key": key, "op": op, "payload": p})
+            keys.add(key)
+            count += 1
+        flush(last=True)
+        replayed = fetch_records()
+
+    # Rows the journal wrote must match the real sheet (other rows, e.g.
+    # imported or typed into the sheet, are not the journal's to explain)
+    expected, actual = journal_rows(replayed, players, entry_ids), journal_rows(sheet, players, entry_ids)
+    for row in (actual - expected).elements():
+        problems.append(f"{row[0]} {row[1] or row[7]}: in the sheet but not in the replay")
+    for row in (expected - actual).elements():
+        problems.append(f"{row[0]} {row[1] or row[7]}: in the replay but not in the sheet")
+
+    elapsed = time.perf_counter() - started
+    return {"entries": len(history), "rows": len(replayed), "seconds": round(elapsed, 2), "violations": problems}
+
+# -----------------------------
+# TELEGRAM BOT (long-poll worker)
+# -----------------------------
+# Enabled with TELEGRAM_BOT_POLLING = true in secrets. One daemon thread per
+# process answers /join, /leave, /paid and /list for every group, reading
+# through the shared records cache and writing through the journal.
+BOT_POLL_TIMEOUT = 25  # seconds per getUpdates long poll
+
+BOT_HELP = (
+    "Commands:\n"
+    "/join [name] - sign up for the coming Sunday\n"
+    "/leave [name] - remove your coming Sunday signup\n"
+    "/paid [name] - mark your latest unpaid session as paid\n"
+    "/list - show the coming Sunday"
+)
+
+def bot_records() -> pd.DataFrame:
+    # Same cache entry as a UI session that hasn't pressed Refresh; every
+    # replayed write bumps the tenant's data version, so neither reads stale rows
+    return load_records_cached(current_tenant()["id"], 0, data_version())
+
+def tenant_for_chat(chat_id):
+    return next((t for t, cfg in TENANTS.items() if cfg["chat_id"] and cfg["chat_id"] == str(chat_id)), None)
+
+def handle_bot_command(text: str, sender: str) -> str:
+    """Run one bot command for the active tenant and return the reply"""
+    parts = text.strip().split(maxsplit=1)
+    cmd = parts[0].split("@")[0].lower()
+    name = (parts[1] if len(parts) > 1 else sender).strip()
+    sunday = get_next_sundays(1)[0]
+
+    if cmd == "/list":
+        return build_dashboard_message(bot_records(), sunday)
+    if cmd not in ("/join", "/leave", "/paid"):
+        return BOT_HELP
+    if not name:
+        return f"Please give a name, e.g. {cmd} Alex"
+
+    df = bot_records()
+    mine = df[
+        df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS) &
+        (df["Player Name"].str.lower() == name.lower())
+    ]
+    label = sunday.strftime("%d %b %y")
+
+    if cmd == "/join":
+        if (mine["Date"] == sunday).any():
+            return f"{name} is already signed up for {label}."
+        full = not has_space(build_capacity_index(df), sunday)
+        entries = [attendance_entry(sunday, name)]
+        reply = f"⏳ {name} added to the waitlist for {label}." if full else f"✅ {name} signed up for {label}."
+
+    elif cmd == "/leave":
+        booking = mine[mine["Date"] == sunday]
+        if booking.empty:
+            return f"{name} is not signed up for {label}."
+        entries = [removal_entry(sunday, r["Player Name"], r["Description"]) for _, r in booking.iterrows()]
+        reply = f"❌ {name} removed from {label}."
+
+    else:
+        unpaid = mine[
+            (mine["Description"].str.lower() == "attendance") &
+            (~mine["Paid"]) &
+            (mine["Date"] <= datetime.date.today())
+        ].sort_values("Date")
+        if unpaid.empty:
+            return f"No unpaid session found for {name}."
+        r = unpaid.iloc[-1]
+        next_week_date = next_sunday_of(r["Date"])
+        entries = [payment_entry(r["Date"], r["Player Name"])]
+        if not (mine["Date"] == next_week_date).any():
+            entries.append(attendance_entry(next_week_date, r["Player Name"]))
+        reply = f"💰 {r['Player Name']} marked paid for {r['Date'].strftime('%d %b %y')}."
+
+    journal_submit(entries)
+    try:
+        replay_journal()
+    except Exception as e:
+        print(f"Bot write pending retry: {str(e)}")
+    return reply
+
+def bot_worker():
+    """Long-poll Telegram for commands and answer them in-process"""
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
+    offset = None
+    while True:
+        try:
+            resp = requests.get(
+                url,
+                params={"timeout": BOT_POLL_TIMEOUT, "offset": offset, "allowed_updates": '["message"]'},
+                timeout=BOT_POLL_TIMEOUT + 10
+            )
+            updates = resp.json().get("result", [])
+        except Exception as e:
+            print(f"Bot poll error: {str(e)}")
+            time.sleep(5)
+            continue
+
+        for update in updates:
+            offset = update["update_id"] + 1
+            message = update.get("message") or {}
+            text = message.get("text", "")
+            tenant_id = tenant_for_chat(message.get("chat", {}).get("id"))
+            if not text.startswith("/") or tenant_id is None:
+                continue
+
+            use_tenant(tenant_id)
+            sender = message.get("from", {}).get("first_name", "")
+            try:
+                reply = handle_bot_command(text, sender)
+            except Exception as e:
+                reply = f"⚠️ Sorry, that failed: {str(e)}"
+            try:
+                send_telegram_message(reply)
+            except Exception as e:
+                print(f"Bot reply error: {str(e)}")
+
+@st.cache_resource(show_spinner=False)
+def start_bot_worker() -> threading.Thread:
+    """Start the bot worker once per process"""
+    worker = threading.Thread(target=bot_worker, name="telegram-bot", daemon=True)
+    worker.start()
+    return worker
+
 # -----------------------------
 # UI STATE
 # -----------------------------
-st.title("Squash Buddies @YCK Attendance, Collection & Expenses")
+# Group is chosen by ?group=<id> or the sidebar when several are configured
+tenant_ids = list(TENANTS)
+tenant_id = st.query_params.get("group", tenant_ids[0])
+if tenant_id not in TENANTS:
+    tenant_id = tenant_ids[0]
+if len(tenant_ids) > 1:
+    tenant_id = st.sidebar.selectbox(
+        "Group",
+        tenant_ids,
+        index=tenant_ids.index(tenant_id),
+        format_func=lambda t: TENANTS[t]["name"]
+    )
+    st.query_params["group"] = tenant_id
+use_tenant(tenant_id)
+tenant = current_tenant()
+
+if st.secrets.get("TELEGRAM_BOT_POLLING", False):
+    start_bot_worker()
+
+st.title(f"{tenant['name']} Attendance, Collection & Expenses")
 
 if "page" not in st.session_state:
     st.session_state.page = "player"
@@ -333,7 +1671,7 @@ if "page" not in st.session_state:
 # Top navigation
 page = st.radio(
     "Navigation",
-    ["👤 Player", "❌ Remove Booking", "💰 Mark Payment", "📉 Expense", "🔄 Refresh"],
+    ["👤 Player", "❌ Remove Booking", "💰 Mark Payment", "📉 Expense", "📈 Stats", "📦 Import / Export", "🔄 Refresh"],
     horizontal=True
 )
 
@@ -345,13 +1683,26 @@ elif page == "💰 Mark Payment":
     st.session_state.page = "payment"
 elif page == "📉 Expense":
     st.session_state.page = "expense"
+elif page == "📈 Stats":
+    st.session_state.page = "stats"
+elif page == "📦 Import / Export":
+    st.session_state.page = "data"
 elif page == "🔄 Refresh":
     st.cache_data.clear()
+    stats_cube(tenant_id).invalidate()
     bust_cache()
     st.rerun()
 
 st.divider()
 
+# Retry sheet writes left pending by an earlier failure
+if journal_pending_count():
+    try:
+        replay_journal()
+        bust_cache()
+    except Exception as e:
+        st.warning(f"Pending changes not yet saved to the sheet ({e})")
+
 # Load data
 next_sundays = get_next_sundays(4)  # Next 4 Sundays for booking
 df = load_records()
@@ -374,30 +1725,26 @@ if st.session_state.page == "player":
     exists = False
     if player_name:
         subset = df[
-            (df["Description"].str.lower() == "attendance") &
+            (df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)) &
             (df["Date"] == play_date) &
             (df["Player Name"].str.strip().str.lower() == player_name.strip().lower())
         ]
         exists = not subset.empty
 
+    capacity_index = load_capacity_index(tenant_id, st.session_state.get("_cache_bust", 0), data_version())
+    full = not has_space(capacity_index, play_date)
+    if full:
+        st.info("This Sunday is full. New signups join the waitlist ⏳")
+
     if st.button("✅ Save Attendance"):
         if not player_name:
             st.error("Please enter your name.")
         elif exists:
             st.warning("You already signed up for this date.")
         else:
-            append_record({
-                "Date": play_date,
-                "Player Name": player_name,
-                "Paid": False,
-                "Court": "",
-                "Time Slot": DEFAULT_TIME_SLOT,
-                "Collection": 0,
-                "Expense": 0,
-                "Description": "Attendance",
-            })
+            submit_mutations([attendance_entry(play_date, player_name)])
             bust_cache()
-            st.success("Saved ✅ See you at court!")
+            st.success("Added to the waitlist ⏳" if full else "Saved ✅ See you at court!")
             send_dashboard_telegram(play_date)
             st.rerun()
 
@@ -454,17 +1801,13 @@ elif st.session_state.page == "payment":
 
                     latest_df = load_records()
                     auto_added_names = []
+                    entries = []
 
                     for _, r in marked.iterrows():
                         player = r["Player Name"].strip()
-                        rownum = int(r["_row"])
-                        
+
                         # Mark payment
-                        update_row_cells(rownum, {
-                            "Paid": True,
-                            "Collection": DEFAULT_FEE,
-                            "Balance": DEFAULT_FEE
-                        })
+                        entries.append(payment_entry(pay_date, player))
 
                         # Auto-book next Sunday
                         already_booked = not latest_df[
@@ -474,18 +1817,11 @@ elif st.session_state.page == "payment":
                         ].empty
 
                         if not already_booked:
-                            append_record({
-                                "Date": next_week_date,
-                                "Player Name": player,
-                                "Paid": False,
-                                "Court": "",
-                                "Time Slot": DEFAULT_TIME_SLOT,
-                                "Collection": 0,
-                                "Expense": 0,
-                                "Description": "Attendance",
-                            })
+                            entries.append(attendance_entry(next_week_date, player))
                             auto_added_names.append(player)
-                    
+
+                    # One journal write, then one batched sheet update for all players
+                    submit_mutations(entries)
                     bust_cache()
 
                     if auto_added_names:
@@ -514,14 +1850,14 @@ elif st.session_state.page == "expense":
             index=0,
             format_func=lambda d: d.strftime("%d %b %y")
         )
-        court_number = st.selectbox("Court number", [1, 2, 3, 4, 5])
-        time_slot = st.selectbox("Time slot", ["2–3pm", "2–4pm", "3–4pm", "4–5pm"])
-        expense_amount = 12 if time_slot == "2–4pm" else 6
+        court_number = st.selectbox("Court number", COURT_NUMBERS)
+        time_slot = st.selectbox("Time slot", list(COURT_SLOT_PRICES))
+        expense_amount = COURT_SLOT_PRICES[time_slot]
 
         st.write(f"Expense: SGD {expense_amount}")
 
         if st.button("✅ Save Court Expense"):
-            append_record({
+            submit_mutations([append_entry({
                 "Date": booking_date,
                 "Player Name": "",
                 "Paid": "",
@@ -530,12 +1866,54 @@ elif st.session_state.page == "expense":
                 "Collection": 0,
                 "Expense": expense_amount,
                 "Description": "Court booking",
-            })
+            })])
             bust_cache()
             st.success("Expense saved ✅")
             send_dashboard_telegram(booking_date, show_fund=True)
             st.rerun()
 
+        st.markdown("#### 🧮 Suggested bookings")
+        target = st.number_input(
+            "Players per court-hour",
+            min_value=1,
+            value=int(tenant["players_per_court_hour"]),
+            step=1
+        )
+        plans = plan_upcoming_courts(df, next_sundays, target)
+
+        st.dataframe(pd.DataFrame([
+            {
+                "Sunday": d.strftime("%d %b %y"),
+                "Signups": p["signups"],
+                "Booked hours": p["booked_hours"],
+                "Extra hours needed": p["need_hours"],
+                "Suggested": ", ".join(f"Court {c} {slot}" for c, slot in p["bookings"]) or "-",
+                "Extra cost (SGD)": p["cost"],
+                "Short (hours)": p["shortfall_hours"],
+            }
+            for d, p in plans.items()
+        ]), hide_index=True, width="stretch")
+
+        suggested = plans[booking_date]["bookings"]
+        if suggested and st.button(f"✅ Book Suggested Courts for {booking_date.strftime('%d %b %y')}"):
+            submit_mutations([
+                append_entry({
+                    "Date": booking_date,
+                    "Player Name": "",
+                    "Paid": "",
+                    "Court": c,
+                    "Time Slot": slot,
+                    "Collection": 0,
+                    "Expense": COURT_SLOT_PRICES[slot],
+                    "Description": "Court booking",
+                })
+                for c, slot in suggested
+            ])
+            bust_cache()
+            st.success("Court expenses saved ✅")
+            send_dashboard_telegram(booking_date, show_fund=True)
+            st.rerun()
+
     else:
         exp_date = st.date_input("Expense date", value=datetime.date.today())
         exp_amount = st.number_input(
@@ -550,7 +1928,7 @@ elif st.session_state.page == "expense":
             if not exp_desc:
                 st.error("Please enter a description.")
             else:
-                append_record({
+                submit_mutations([append_entry({
                     "Date": exp_date,
                     "Player Name": "",
                     "Paid": "",
@@ -559,7 +1937,7 @@ elif st.session_state.page == "expense":
                     "Collection": 0,
                     "Expense": exp_amount,
                     "Description": exp_desc,
-                })
+                })])
                 bust_cache()
                 st.success("Expense saved ✅")
                 send_dashboard_telegram(next_sundays[0], show_fund=True)
@@ -571,9 +1949,9 @@ elif st.session_state.page == "expense":
 elif st.session_state.page == "remove":
     st.subheader("❌ Remove Booking")
 
-    # Get dates from sheet that have attendance records
+    # Get dates from sheet that have attendance or waitlist records
     attendance_dates = df[
-        (df["Description"].str.lower() == "attendance") & 
+        (df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)) &
         (df["Player Name"].str.strip() != "")
     ]["Date"].dropna().unique()
     
@@ -590,7 +1968,7 @@ elif st.session_state.page == "remove":
         )
 
         attendance = df[
-            (df["Description"].str.lower() == "attendance") &
+            (df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)) &
             (df["Date"] == remove_date) &
             (df["Player Name"].str.strip() != "")
         ].copy()
@@ -599,7 +1977,8 @@ elif st.session_state.page == "remove":
             st.info("No attendance bookings found for this Sunday.")
         else:
             attendance["label"] = attendance.apply(
-                lambda r: f"{r['Player Name']} | {r['Date'].strftime('%d %b %y')}",
+                lambda r: f"{r['Player Name']} | {r['Date'].strftime('%d %b %y')}"
+                + (" | waitlist" if r["Description"].lower() == "waitlist" else ""),
                 axis=1
             )
             selected = st.multiselect(
@@ -611,13 +1990,64 @@ elif st.session_state.page == "remove":
                 if not selected:
                     st.warning("Please select at least one booking.")
                 else:
-                    rows = attendance[attendance["label"].isin(selected)]["_row"].tolist()
-                    delete_sheet_rows(rows)
+                    chosen = attendance[attendance["label"].isin(selected)]
+                    submit_mutations([
+                        removal_entry(remove_date, n, d)
+                        for n, d in zip(chosen["Player Name"], chosen["Description"])
+                    ])
                     bust_cache()
                     st.success("Removed ✅")
                     send_dashboard_telegram(remove_date)
                     st.rerun()
 
+# -----------------------------
+# SECTION: STATS
+# -----------------------------
+elif st.session_state.page == "stats":
+    st.subheader("📈 Stats")
+
+    cube = stats_cube(tenant_id)
+    cube.sync(df)
+
+    tab_players, tab_sundays, tab_months = st.tabs(["Players", "Sundays", "Months"])
+    with tab_players:
+        st.dataframe(cube.players(), width="stretch")
+    with tab_sundays:
+        st.dataframe(cube.sundays(), width="stretch")
+    with tab_months:
+        st.dataframe(cube.months(), width="stretch")
+
+# -----------------------------
+# SECTION: IMPORT / EXPORT
+# -----------------------------
+elif st.session_state.page == "data":
+    st.subheader("📦 Import / Export (Organizer)")
+
+    uploaded = st.file_uploader("Import records (CSV or XLSX)", type=["csv", "xlsx"])
+
+    if st.button("✅ Import Records"):
+        if uploaded is None:
+            st.error("Please choose a file to import.")
+        else:
+            try:
+                with st.spinner("Importing..."):
+                    summary = import_records(uploaded, load_records())
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                bust_cache()
+                st.success(
+                    f"Imported {summary['imported']} rows ✅ "
+                    f"(skipped {summary['duplicates']} duplicates, {summary['rejected']} invalid)"
+                )
+
+    export_fmt = st.radio("Export format", ["csv", "xlsx"], horizontal=True)
+    st.download_button(
+        "⬇️ Export Records",
+        data=export_records(df, export_fmt),
+        file_name=f"squashbuddies_{datetime.date.today():%Y%m%d}.{export_fmt}",
+    )
+
 # -----------------------------
 # DASHBOARD (Shows Coming Sunday by default)
 # -----------------------------
@@ -705,79 +2135,88 @@ if players.empty:
 
 else:
 
-    for _, r in players.iterrows():
-
-        name = r["Player Name"]
-        paid = r["Paid"]
-        rownum = int(r["_row"])
-
-        icon = "✅" if paid else "❌"
-
-        c1, c2, c3 = st.columns([8,1,1], gap="small")
-
-        # Player name
-        with c1:
-            st.markdown(f"{icon} **{name}**")
-
-        # Mark payment
-        with c2:
-
-            if not paid:
-
-                if st.button("[💰]", key=f"pay_{rownum}"):
-
-                    update_row_cells(rownum, {
-                        "Paid": True,
-                        "Collection": DEFAULT_FEE,
-                        "Balance": DEFAULT_FEE
-                    })
-
-                    next_week_date = next_sunday_of(selected_date)
-
-                    latest_df = load_records()
-
-                    already_booked = not latest_df[
-                        (latest_df["Description"].str.lower() == "attendance") &
-                        (latest_df["Date"] == next_week_date) &
-                        (latest_df["Player Name"].str.lower() == name.lower())
-                    ].empty
-
-                    if not already_booked:
-
-                        append_record({
-                            "Date": next_week_date,
-                            "Player Name": name,
-                            "Paid": False,
-                            "Court": "",
-                            "Time Slot": DEFAULT_TIME_SLOT,
-                            "Collection": 0,
-                            "Expense": 0,
-                            "Description": "Attendance",
-                        })
-
-                    bust_cache()
-                    send_dashboard_telegram(next_week_date)
-                    st.rerun()
-
-        # Remove booking
-        with c3:
-
-            if st.button("[🚫]", key=f"remove_{rownum}"):
-
-                delete_sheet_rows([rownum])
+    # Only one page of players is rendered; ticks are applied together on Apply
+    page_count = math.ceil(len(players) / DASHBOARD_PAGE_SIZE)
+    page_no = 1
+    if page_count > 1:
+        page_no = st.number_input(
+            f"Page (of {page_count})",
+            min_value=1,
+            max_value=page_count,
+            value=1,
+            step=1
+        )
+    view = players.iloc[(page_no - 1) * DASHBOARD_PAGE_SIZE:page_no * DASHBOARD_PAGE_SIZE]
+
+    shown = pd.DataFrame({
+        "Player": [("✅ " if paid else "❌ ") + name for name, paid in zip(view["Player Name"], view["Paid"])],
+        "Paid": view["Paid"].astype(bool).tolist(),
+        "Remove": False,
+    }, index=view["_row"].astype(int))
+
+    # Edits are by position, so start fresh whenever the shown rows change,
+    # including reloads after another session's writes or the cache expiring
+    fingerprint = hashlib.sha1(
+        repr(list(zip(shown.index, view["Player Name"], shown["Paid"]))).encode()
+    ).hexdigest()[:12]
+
+    edited = st.data_editor(
+        shown,
+        key=f"attendance_{selected_date}_{page_no}_{st.session_state.get('_cache_bust', 0)}_{fingerprint}",
+        hide_index=True,
+        disabled=["Player"],
+        width="stretch",
+        column_config={
+            "Paid": st.column_config.CheckboxColumn("💰 Paid"),
+            "Remove": st.column_config.CheckboxColumn("🚫 Remove"),
+        },
+    )
 
-                bust_cache()
+    names = view.set_index(view["_row"].astype(int))["Player Name"]
+    removed = edited.index[edited["Remove"]]
+    newly_paid = edited.index[edited["Paid"] & ~shown["Paid"] & ~edited["Remove"]]
+
+    if len(removed) or len(newly_paid):
+        st.caption(f"{len(newly_paid)} to mark paid, {len(removed)} to remove")
+
+        if st.button("✅ Apply Changes"):
+            next_week_date = next_sunday_of(selected_date)
+            booked_next = set(df[
+                (df["Description"].str.lower().isin(SIGNUP_DESCRIPTIONS)) &
+                (df["Date"] == next_week_date)
+            ]["Player Name"].str.lower())
+
+            entries = []
+            for row in newly_paid:
+                entries.append(payment_entry(selected_date, names[row]))
+                if names[row].lower() not in booked_next:
+                    entries.append(attendance_entry(next_week_date, names[row]))
+            entries += [removal_entry(selected_date, names[row]) for row in removed]
+
+            # One journal write, then one batched sheet write for every change
+            submit_mutations(entries)
+            bust_cache()
+            if len(newly_paid):
+                send_dashboard_telegram(next_week_date)
+            if len(removed):
                 send_dashboard_telegram(selected_date)
-                st.rerun()
+            st.rerun()
+
+# Waitlist
+waitlist_df = sunday_df[sunday_df["Description"].str.lower() == "waitlist"].sort_values("_row")
+if not waitlist_df.empty:
+    st.markdown("### ⏳ Waitlist")
+    for i, name in enumerate(waitlist_df["Player Name"], 1):
+        st.write(f"{i}. {name}")
 
 # Fund Summary
 #st.markdown("### 💰 Our Funds")
-st.caption("Court share @$4 | PayNow/PayLah to Seah 97333133")
+st.caption(f"Court share @${tenant['fee']} | PayNow/PayLah to {tenant['payee']} {tenant['paynow']}".replace("  ", " "))
 
 total_collection = pd.to_numeric(df["Collection"], errors="coerce").fillna(0).sum()
 total_expense = pd.to_numeric(df["Expense"], errors="coerce").fillna(0).sum()
 
-balance = initial_balance + total_collection - total_expense
+balance = tenant["initial_balance"] + total_collection - total_expense
 
 #col1, col2, col3 = st.columns(3)
 #col1.metric("Collection", f"SGD {total_collection:.2f}")
@@ -806,6 +2245,35 @@ with st.expander("🧪 Test Tools (For Admin Only)"):
             test_msg = f"🧪 Test message from Squash Buddies at {datetime.datetime.now().strftime('%H:%M:%S')}"
             send_telegram_message(test_msg)
             st.success("Test message sent! Check Telegram.")
+
+    st.subheader("Ledger Replay Check")
+    st.caption("Runs against an in-memory copy, never the real sheet.")
+
+    col1, col2 = st.columns(2)
+    seed = col1.number_input("Seed", min_value=0, value=0, step=1)
+    steps = col2.number_input("Operations", min_value=10, max_value=500, value=200, step=50)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        if st.button("🎲 Run Randomized Check"):
+            with st.spinner("Replaying..."):
+                result = run_random_ledger_check(int(seed), int(steps))
+            if result["violations"]:
+                st.error(f"❌ {len(result['violations'])} invariant violations")
+            else:
+                st.success(f"✅ {result['steps']} operations, {result['rows']} rows in {result['seconds']}s")
+            st.json(result)
+
+    with col2:
+        if st.button("🔁 Replay Journal History"):
+            with st.spinner("Replaying..."):
+                result = replay_journal_history()
+            if result["violations"]:
+                st.error(f"❌ {len(result['violations'])} invariant violations")
+            else:
+                st.success(f"✅ {result['entries']} entries, {result['rows']} rows in {result['seconds']}s")
+            st.json(result)
     
 # -----------------------------
 # TUESDAY REMINDER CHECK (Simple & Reliable-chatgpt)
@@ -819,24 +2287,33 @@ def check_tuesday_reminder():
         if now.weekday() != 1:
             return
 
-        # File flag to prevent duplicate reminders
-        flag_file = f"reminder_sent_{now.strftime('%Y%m%d')}.txt"
+        # Every group gets its reminder, whichever group's page is open
+        for group_id, group in TENANTS.items():
+            if not group["chat_id"]:
+                continue
 
-        import os
-        if os.path.exists(flag_file):
-            return  # reminder already sent today
+            # File flag (one per group) to prevent duplicate reminders
+            flag_file = f"reminder_sent_{now.strftime('%Y%m%d')}.txt"
+            if group_id != DEFAULT_TENANT_ID:
+                flag_file = f"reminder_sent_{group_id}_{now.strftime('%Y%m%d')}.txt"
 
-        with st.spinner("📨 Sending Tuesday reminder..."):
-            result = send_unpaid_reminder()
+            if os.path.exists(flag_file):
+                continue  # reminder already sent today
 
-            if result:
-                open(flag_file, "w").close()
-                st.success("✅ Tuesday reminder sent!")
-            else:
-                st.info("No unpaid players found.")
+            use_tenant(group_id)
+            with st.spinner(f"📨 Sending Tuesday reminder to {group['name']}..."):
+                result = send_unpaid_reminder()
+
+                if result:
+                    open(flag_file, "w").close()
+                    st.success(f"✅ Tuesday reminder sent to {group['name']}!")
+                else:
+                    st.info(f"No unpaid players found for {group['name']}.")
 
     except Exception as e:
         st.error(f"Reminder error: {str(e)}")
+    finally:
+        use_tenant(tenant_id)
 
 
 # Run automatically when app loads